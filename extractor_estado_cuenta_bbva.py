@@ -13,17 +13,20 @@ extract_bank_statement.py — Convierte un estado de cuenta BBVA a Excel
     1. **Movimientos** – lista de transacciones del PDF actual.
     2. **Totales**      – Total abonos y Total cargos del PDF actual.
 
-Dependencias: `pip install pdfplumber pandas openpyxl`
+Dependencias: `pip install pypdfium2 pdfplumber pandas XlsxWriter`
+(pdfplumber sólo se usa como respaldo para PDFs que PDFium no abre)
 """
 from __future__ import annotations
 
 import re
 import sys
 from pathlib import Path
-from typing import List, Literal
+from typing import Iterable, Iterator, List, Literal, Tuple
 
+import numpy as np
 import pandas as pd
 import pdfplumber
+import pypdfium2 as pdfium
 
 # ─── CONFIG ──────────────────────────────────────────────────────────
 PDF_PATH   = r"C:/Users/Juan/Downloads/angela.pdf"            # PDF de entrada
@@ -32,52 +35,80 @@ ACCOUNT_TYPE: Literal["credito", "debito"] = "debito"       # tipo de cuenta
 # ────────────────────────────────────────────────────────────────────
 
 # Expresiones
-RE_FECHA = re.compile(r"^(\d{2}/[A-Z]{3})\s+(\d{2}/[A-Z]{3})\s+(.*)")
 NUM_DEC  = r"\d{1,3}(?:,\d{3})*\.\d{2}"      # número con decimales
 RE_NUMS  = re.compile(NUM_DEC)
-RE_CREDITO = re.compile(rf"(?P<desc>.+?)\s+(?P<sign>[+-])\s*\$?\s*(?P<val>{NUM_DEC})$", re.IGNORECASE)
-
-clean_num = lambda s: float(s.replace(",", "")) if s else None
+RE_DEB_FULL = re.compile(                     # cabecera débito: fechas, texto y montos finales
+    rf"^(\d{{2}}/[A-Z]{{3}})\s+(\d{{2}}/[A-Z]{{3}})\s+(.*?)((?:\s*{NUM_DEC})*)\s*$"
+)
+RE_CREDITO = re.compile(                      # multilínea ([^\S\n] no cruza de línea); desc codiciosa:
+    # el motor salta al final de la línea y sólo retrocede sobre el monto; sin descripción,
+    # [^\S\n] conserva la fila con desc=" " como hacía la versión perezosa
+    rf"^(?P<desc>.*\S|[^\S\n])[^\S\n]+(?P<sign>[+-])[^\S\n]*\$?[^\S\n]*(?P<val>{NUM_DEC})$", re.IGNORECASE | re.MULTILINE
+)
+
+def clean_num(s: str | None) -> float | None:
+    # str.replace es ~10x más rápido que str.translate para quitar una sola ","
+    return float(s.replace(",", "")) if s else None
 
 # ─── Utilidades ─────────────────────────────────────────────────────
 
-def pdf_to_lines(pdf: Path) -> List[str]:
-    lines: List[str] = []
-    with pdfplumber.open(pdf) as doc:
-        for page in doc.pages:
-            lines.extend(l.strip() for l in (page.extract_text() or "").splitlines())
-    return lines
+def _page_lines(text: str | None) -> List[str]:
+    return [l.strip() for l in (text or "").splitlines()]
+
+def pdf_to_lines(pdf: Path) -> Iterator[str]:
+    # Generador: entrega las líneas página por página sin materializar todo el PDF
+    try:
+        doc = pdfium.PdfDocument(pdf)
+    except pdfium.PdfiumError:
+        # Respaldo: PDFs que PDFium no abre se leen con pdfplumber
+        with pdfplumber.open(pdf) as doc:
+            for page in doc.pages:
+                yield from _page_lines(page.extract_text())
+        return
+
+    # Un solo documento abierto, páginas en secuencia; PDFium devuelve el texto plano
+    # sin reconstruir la geometría de pdfplumber (~1 ms/página, no compensa un pool)
+    with doc:
+        for page in doc:
+            yield from _page_lines(page.get_textpage().get_text_range())
 
 # ─── Parsing débito ─────────────────────────────────────────────────
 
-def parse_debito(lines: List[str]) -> pd.DataFrame:
-    i, n = 0, len(lines)
-    moves = []
-    while i < n:
-        head = RE_FECHA.match(lines[i])
-        if not head:
-            i += 1
-            continue
-
+def _movimientos_debito(lines: Iterable[str]) -> Iterator[Tuple[re.Match, List[str]]]:
+    # Agrupa el flujo en (cabecera, líneas siguientes), un movimiento a la vez
+    head: re.Match[str] | None = None
+    cont: List[str] = []
+    for l in lines:
+        m = l[2:3] == "/" and RE_DEB_FULL.match(l)   # filtro barato: cabecera empieza con "dd/"
+        if m:
+            if head:
+                yield head, cont
+            head, cont = m, []
+        elif head:
+            cont.append(l)
+    if head:
+        yield head, cont
+
+def parse_debito(lines: Iterable[str]) -> pd.DataFrame:
+    descs: List[str] = []
+    cargos: List[float | None] = []
+    abonos: List[float | None] = []
+    for head, cont in _movimientos_debito(lines):
         cargo = abono = None
         desc_parts: List[str] = []
 
-        tail = head.group(3)
-        nums_head = RE_NUMS.findall(tail)
-        if nums_head:
+        tail, nums_tail = head.group(3, 4)
+        if nums_tail:
+            nums_head = RE_NUMS.findall(nums_tail)
             if len(nums_head) == 1:
                 abono = clean_num(nums_head[0])
             else:
                 cargo = clean_num(nums_head[0])
-            tail = RE_NUMS.sub("", tail).strip()
         if tail:
             desc_parts.append(tail)
-        i += 1
 
-        while i < n and not RE_FECHA.match(lines[i]):
-            l = lines[i]
+        for l in cont:
             if not l or "referencia" in l.lower():
-                i += 1
                 continue
             nums = RE_NUMS.findall(l)
             if nums and cargo is None and abono is None:
@@ -87,43 +118,45 @@ def parse_debito(lines: List[str]) -> pd.DataFrame:
                     cargo = clean_num(nums[0])
             elif not nums:
                 desc_parts.append(l)
-            i += 1
 
         descripcion = " ".join(desc_parts)
-        # Regla: SPEI RECIBIDO nunca es cargo
-        if "SPEI RECIBIDO" in descripcion.upper() and cargo is not None and abono is None:
+        # Regla: SPEI RECIBIDO nunca es cargo (montos primero: upper() sólo si hace falta)
+        if cargo is not None and abono is None and "SPEI RECIBIDO" in descripcion.upper():
             abono, cargo = cargo, None
 
         if cargo is None and abono is None:
             continue
-        moves.append({"Descripción": descripcion, "Cargo": cargo, "Abono": abono})
-    return pd.DataFrame(moves)
+        descs.append(descripcion)
+        cargos.append(cargo)
+        abonos.append(abono)
+    return pd.DataFrame({
+        "Descripción": descs,
+        "Cargo": np.array(cargos, dtype="float64"),
+        "Abono": np.array(abonos, dtype="float64"),
+    })
 
 # ─── Parsing crédito (simplificado) ────────────────────────────────
 
-def parse_credito(lines: List[str]) -> pd.DataFrame:
-    rows = []
-    for l in lines:
-        m = RE_CREDITO.search(l)
-        if m:
-            val = clean_num(m.group("val"))
-            rows.append({
-                "Descripción": m.group("desc"),
-                "Cargo": val if m.group("sign") == "-" else None,
-                "Abono": val if m.group("sign") == "+" else None,
-            })
-    return pd.DataFrame(rows)
+def parse_credito(lines: Iterable[str]) -> pd.DataFrame:
+    texto = "\n".join(l for l in lines if l[-3:-2] == ".")   # sólo líneas que terminan en monto
+    m = pd.DataFrame(RE_CREDITO.findall(texto), columns=["desc", "sign", "val"])
+    val = m["val"].str.replace(",", "", regex=False).astype("float64")
+    return pd.DataFrame({
+        "Descripción": m["desc"],
+        "Cargo": val.where(m["sign"] == "-"),
+        "Abono": val.where(m["sign"] == "+"),
+    })
 
 # ─── Export a Excel ────────────────────────────────────────────────
 
 def export_to_excel(df: pd.DataFrame, out: Path):
-    total_abono = df["Abono"].fillna(0).sum()
-    total_cargo = df["Cargo"].fillna(0).sum()
+    total_abono = np.nansum(df["Abono"].to_numpy())   # float64 con NaN: sin copia intermedia
+    total_cargo = np.nansum(df["Cargo"].to_numpy())
     totales = pd.DataFrame({
         "Concepto": ["Total abonos", "Total cargos"],
         "Monto": [total_abono, total_cargo],
     })
-    with pd.ExcelWriter(out, engine="openpyxl", mode="w") as w:
+    with pd.ExcelWriter(out, engine="xlsxwriter", mode="w") as w:
         df.to_excel(w, sheet_name="Movimientos", index=False)
         totales.to_excel(w, sheet_name="Totales", index=False)
 